@@ -1,9 +1,12 @@
 # ========= CONFIG =========
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from docx import Document
 from openpyxl import Workbook, load_workbook
-import pdfplumber
-import re, unicodedata
+import pypdfium2 as pdfium
+from collections import deque
+import re, unicodedata, zipfile
+import xml.etree.ElementTree as ET
 
 HERE       = Path(__file__).parent.resolve()
 INPUT_DIR  = HERE
@@ -14,27 +17,42 @@ SHEET_NAME = "Sheet1"
 DASH_CHARS = "\u2010\u2011\u2012\u2013\u2014\u2015\u2212-"
 ZERO_WIDTH = "\u200b\u200c\u200d\u2060\uFEFF\u200e\u200f"
 NBSP       = "\u00A0"
-DASH_RE    = re.compile(f"[{re.escape(DASH_CHARS)}]")
+DASH_TABLE = str.maketrans(dict.fromkeys(DASH_CHARS, "-"))
+WS_RE      = re.compile(r"[ \t]+")
+MULTI_WS   = re.compile(r"\s{2,}")
+STRIP_CHARS = " -.()[]:;\t\n\r"
+
+# one translate() pass: drop zero-widths, NBSP -> space, CR -> LF, dashes -> "-"
+ZW_TABLE   = dict.fromkeys(map(ord, ZERO_WIDTH))
+NORM_TABLE = {**ZW_TABLE, **DASH_TABLE, ord(NBSP): " ", ord("\r"): "\n"}
 
 def norm(s: str) -> str:
-    s = unicodedata.normalize("NFKC", s)
-    for ch in ZERO_WIDTH: s = s.replace(ch, "")
-    s = s.replace(NBSP, " ").replace("\r", "\n")
-    s = re.sub(r"[ \t]+", " ", s)
-    s = DASH_RE.sub("-", s)
+    if s.isascii():
+        # CR is the only NORM_TABLE entry that can occur in ASCII text
+        s = s.replace("\r", "\n")
+    else:
+        s = unicodedata.normalize("NFKC", s).translate(NORM_TABLE)
+    s = WS_RE.sub(" ", s)
     return s.strip()
 
 def tidy(s: str) -> str:
-    s = re.sub(r"\s{2,}", " ", s)
-    return s.strip(" -.()[]:;").strip()
+    s = MULTI_WS.sub(" ", s)
+    return s.strip(STRIP_CHARS)
 
 # ========= HEADERS / ITEMS =========
 HEADERS = ["AFI", "Classification", "Recommendation", "Entity", "EE/FA", "Source File"]
-RE_AFI_HDR   = re.compile(r"(?i)^\s*areas?\s+(for|of)\s+improvement\s*:?\s*$")
-RE_RECO_HDR  = re.compile(r"(?i)^\s*recommendations?\s*:?\s*$")
-RE_PROCESS   = re.compile(r"(?i)^\s*process\s*[:\-]?\s*([0-9]+(?:\.[0-9]+)*)\s+(.+)$")
-RE_PROC_SIMPLE = re.compile(r"(?i)^\s*(Value|Operational|Business)\b(?:\s*[:\-–—]\s*(.+))?$")
-RE_NUM_ITEM  = re.compile(r"^\s*(\d+)\s*-\s*(.+?)\s*$")
+# section headers and numbered items, fused into one alternation so each line
+# costs a single match(); classify by m.lastgroup
+LINE_KIND = re.compile(
+    r"(?P<process>(?i:\s*process\s*[:\-]?\s*(?P<proc_no>[0-9]+(?:\.[0-9]+)*)\s+(?P<proc_name>.+))$)"
+    r"|(?P<simple>(?i:\s*(?P<simple_head>Value|Operational|Business)\b(?:\s*[:\-–—]\s*(?P<simple_tail>.+))?)$)"
+    r"|(?P<afi_hdr>(?i:\s*areas?\s+(?:for|of)\s+improvement\s*:?\s*)$)"
+    r"|(?P<reco_hdr>(?i:\s*recommendations?\s*:?\s*)$)"
+    r"|(?P<item>\s*(?P<item_no>\d+)\s*-\s*(?P<item_text>.+?)\s*$)"
+)
+# first characters LINE_KIND can match on (lines arrive stripped), plus digits;
+# anything else is plain text and skips the regex entirely
+KIND_FIRST = frozenset("parvob")
 
 # ========= TOC DETECTOR =========
 DOT_LEADER = re.compile(r".{2,}\.{3,}\s*\d+\s*$")
@@ -47,79 +65,166 @@ def is_toc_page(lines):
     return dots >= 3
 
 # ========= Classification/Entity extraction =========
+PAREN_LINE = re.compile(r"\([^)]*\)")
+# matched against the reversed string: the first hit is the last keyword
+KW_CLASS_REV = re.compile(r"(?i)\b(rojam|rehto)\b")
+
+def last_paren(s: str):
+    """(start, end, inside) of the last "(...)" group, scanning from the right.
+    Same span the last match of r"\(([^)]*?)\)" would give, or None."""
+    close = s.rfind(")")
+    if close == -1: return None
+    op = s.rfind("(", 0, close)
+    if op == -1: return None
+    close = s.find(")", op)
+    op = s.find("(", s.rfind(")", 0, op) + 1)
+    return op, close + 1, s[op+1:close]
+
 def extract_ce_anywhere(text: str):
     s = text
-    m_last = None
-    for m in re.finditer(r"\(([^)]*?)\)", s):
-        m_last = m
-    if m_last:
-        inside = DASH_RE.sub("-", m_last.group(1)).strip()
+    p = last_paren(s)
+    if p:
+        start, end, inside = p
+        inside = inside.translate(DASH_TABLE).strip()
         parts = inside.split("-", 1)
         cls   = tidy(parts[0]) if parts else ""
         ent   = tidy(parts[1]) if len(parts) > 1 else ""
         if cls or ent:
-            s = (s[:m_last.start()] + " " + s[m_last.end():]).strip()
+            s = (s[:start] + " " + s[end:]).strip()
             return tidy(s), cls, ent
-    m_kw = None
-    for m in re.finditer(r"(?i)\b(major|other)\b", s):
-        m_kw = m
+    m_kw = KW_CLASS_REV.search(s[::-1])
     if m_kw:
-        dash = s.find("-", m_kw.start())
+        kw_start = len(s) - m_kw.end()
+        dash = s.find("-", kw_start)
         if dash != -1:
-            cls = m_kw.group(1).capitalize()
+            cls = m_kw.group(1)[::-1].capitalize()
             ent = tidy(s[dash+1:])
             if ent:
-                s = tidy(s[:m_kw.start()])
+                s = tidy(s[:kw_start])
                 return s, cls, ent
     return tidy(s), "", ""
 
-def extract_ce_across_lines(line_list, idx, first_line):
+def extract_ce_across_lines(next_line, first_line):
+    """next_line() yields the following lines (None at the end); an unclosed
+    "(" pulls lines until one closes it. Also returns the lines pulled."""
     line = first_line
-    if "(" in line and ")" not in line:
-        buf = [line[line.index("("):]]
-        j = idx + 1
-        while j < len(line_list):
-            buf.append(line_list[j])
-            if ")" in line_list[j]:
+    used = []
+    op = line.find("(")
+    if op != -1 and ")" not in line:
+        buf = [line[op:]]
+        while True:
+            nxt = next_line()
+            if nxt is None:
+                break
+            used.append(nxt)
+            buf.append(nxt)
+            if ")" in nxt:
                 break
-            j += 1
         combined = norm(" ".join(buf))
-        m_last = None
-        for m in re.finditer(r"\(([^)]*?)\)", combined):
-            m_last = m
-        if m_last:
-            inside = DASH_RE.sub("-", m_last.group(1)).strip()
+        p = last_paren(combined)
+        if p:
+            start, end, inside = p
+            inside = inside.translate(DASH_TABLE).strip()
             parts = inside.split("-", 1)
             cls   = tidy(parts[0]) if parts else ""
             ent   = tidy(parts[1]) if len(parts) > 1 else ""
-            cleaned = norm(first_line.replace(combined[m_last.start():m_last.end()], " "))
-            return tidy(cleaned), cls, ent, min(j, len(line_list)-1)
-        return tidy(first_line), "", "", min(j, len(line_list)-1)
+            cleaned = norm(first_line.replace(combined[start:end], " "))
+            return tidy(cleaned), cls, ent, used
+        return tidy(first_line), "", "", used
     clean, cls, ent = extract_ce_anywhere(first_line)
-    return clean, cls, ent, idx
+    return clean, cls, ent, used
 
 # ========= READERS =========
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+def docx_run_text(r):
+    out = []
+    for e in r:
+        if e.tag == W+"t": out.append(e.text or "")
+        elif e.tag in (W+"tab", W+"ptab"): out.append("\t")
+        elif e.tag == W+"cr": out.append("\n")
+        elif e.tag == W+"br" and e.get(W+"type", "textWrapping") == "textWrapping": out.append("\n")
+        elif e.tag == W+"noBreakHyphen": out.append("-")
+    return "".join(out)
+
+def docx_para_text(p):
+    # runs and hyperlinked runs directly under <w:p>, as python-docx's Paragraph.text
+    out = []
+    for e in p:
+        if e.tag == W+"r": out.append(docx_run_text(e))
+        elif e.tag == W+"hyperlink": out.extend(docx_run_text(r) for r in e.iterfind(W+"r"))
+    return "".join(out)
+
+def docx_row_cells(tr, above):
+    """Cell texts of a table row, one per grid column like python-docx's
+    row.cells: spanned cells repeat, vertically merged ones take the text
+    above. `above` maps grid offset -> text for the previous row."""
+    cells, grid = [], {}
+    gb = tr.find(f"{W}trPr/{W}gridBefore")
+    col = int(gb.get(W+"val", 0)) if gb is not None else 0
+    for tc in tr.iterfind(W+"tc"):
+        span = tc.find(f"{W}tcPr/{W}gridSpan")
+        span = int(span.get(W+"val", 1)) if span is not None else 1
+        vm = tc.find(f"{W}tcPr/{W}vMerge")
+        if vm is not None and vm.get(W+"val", "continue") == "continue":
+            text = above.get(col, "")
+        else:
+            text = "\n".join(docx_para_text(p) for p in tc.iterfind(W+"p"))
+        grid[col] = text
+        cells += [text] * span
+        col += span
+    return cells, grid
+
 def yield_lines_docx(doc_path: Path):
-    doc = Document(doc_path)
-    for p in doc.paragraphs:
-        t = norm(p.text)
-        if t: yield t
-    for tbl in doc.tables:
-        for row in tbl.rows:
-            for cell in row.cells:
-                for raw in cell.text.splitlines():
-                    t = norm(raw)
-                    if t: yield t
+    # stream word/document.xml instead of building python-docx's object model;
+    # body paragraphs come first, then table cells, the same order as before
+    table_lines = []
+    path, above = [], {}
+    with zipfile.ZipFile(doc_path) as z, z.open("word/document.xml") as f:
+        for ev, el in ET.iterparse(f, events=("start", "end")):
+            if ev == "start":
+                path.append(el.tag)
+                if len(path) == 2: body = el
+                elif len(path) == 3 and el.tag == W+"tbl": above = {}
+                continue
+            if len(path) == 3 and el.tag == W+"p":
+                t = norm(docx_para_text(el))
+                if t: yield t
+            elif len(path) == 4 and el.tag == W+"tr" and path[2] == W+"tbl":
+                cells, above = docx_row_cells(el, above)
+                for text in cells:
+                    for raw in text.splitlines():
+                        t = norm(raw)
+                        if t: table_lines.append(t)
+                el.clear()
+            path.pop()
+            if len(path) == 2: body.clear()
+    yield from table_lines
 
 def yield_lines_pdf(pdf_path: Path):
-    with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages:
-            text = page.extract_text() or ""
-            lines = [norm(x) for x in text.splitlines() if norm(x)]
+    # text only: PDFium's native extractor, no per-char layout objects
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        for page in pdf:
+            tp = page.get_textpage()
+            text = tp.get_text_range() or ""
+            tp.close(); page.close()
+            # PDFium marks a line ending in "-" with U+FFFE and joins it to the
+            # next one; restore the hyphen and the break (U+FFFE isn't XML-safe)
+            text = text.replace("\ufffe", "-\n")
+            # a TOC title is visible in the raw text too: skip before normalizing
+            if TOC_TITLE.search(text):
+                continue
+            lines = []
+            for x in text.splitlines():
+                t = norm(x)
+                if t: lines.append(t)
             if is_toc_page(lines):
                 continue
             for ln in lines:
                 yield ln
+    finally:
+        pdf.close()
 
 def yield_lines_any(path: Path):
     if path.suffix.lower() == ".docx":
@@ -130,21 +235,22 @@ def yield_lines_any(path: Path):
 # ========= EXCEL HELPERS =========
 def open_or_create_workbook(path: Path, sheet: str):
     if path.exists():
+        # full load so formatting, charts etc. survive the save
         wb = load_workbook(path)
         ws = wb[sheet] if sheet in wb.sheetnames else wb.active
-        if ws.max_row < 1:
-            ws.append(HEADERS)
+        headers = next(ws.iter_rows(max_row=1, values_only=True), ())
     else:
-        wb = Workbook()
-        ws = wb.active
-        ws.title = sheet
+        # fresh file: write-only mode streams rows out instead of keeping a cell grid
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(sheet)
         ws.append(HEADERS)
-    return wb, ws
+        headers = HEADERS
+    return wb, ws, headers
 
-def detect_columns(ws):
+def detect_columns(headers):
     names = {}
-    for col in range(1, ws.max_column + 1):
-        v = (ws.cell(1, col).value or "").strip().lower()
+    for col, v in enumerate(headers, 1):
+        v = (v or "").strip().lower()
         if v: names[v] = col
     col_afi     = names.get("afi", 1)
     col_class   = names.get("classification", 2)
@@ -154,31 +260,39 @@ def detect_columns(ws):
     col_file    = names.get("source file", 7)
     return col_afi, col_class, col_reco, col_entity, col_process, col_file
 
-def next_row(ws): 
-    return max(ws.max_row + 1, 2)
-
-def write_row(ws, row, cols, afi_text, cls, ent, reco_text, process_label, src_file):
-    col_afi, col_class, col_reco, col_entity, col_process, col_file = cols
+def make_row(afi_text, cls, ent, reco_text, process_label, src_file):
+    """Row tuple in HEADERS order."""
     clean_afi, c2, e2 = extract_ce_anywhere(afi_text)
     if not cls and c2: cls = c2
     if not ent and e2: ent = e2
-    ws.cell(row, col_afi).value     = clean_afi
-    ws.cell(row, col_class).value   = cls
-    ws.cell(row, col_reco).value    = reco_text
-    ws.cell(row, col_entity).value  = ent
-    ws.cell(row, col_process).value = process_label
-    ws.cell(row, col_file).value    = src_file
+    return clean_afi, cls, reco_text, ent, process_label, src_file
+
+def write_row(ws, cols, width, row):
+    vec = [None] * width
+    for col, v in zip(cols, row):
+        vec[col-1] = v
+    ws.append(vec)
 
 # ========= CORE PARSER =========
-def process_file(path: Path, ws, cols, start_row: int) -> int:
-    row = start_row
+@dataclass
+class Afi:
+    __slots__ = ("text", "cls", "ent")
+    text: str
+    cls: str
+    ent: str
+
+def parse_file(path: Path) -> list:
+    """Parse one report into row tuples (see make_row); no workbook access,
+    so files can be parsed in worker processes."""
+    rows = []
     in_afi = in_reco = False
     process_label = ""
-    afis = []
+    afis = {}            # AFI number -> records, in the order they were read
     recs = {}
+    seq = 1              # next number for AFIs that carry none
     cur_rec_num = None
     cur_rec_parts = []
-    last_afi_idx = None
+    last_afi = None
 
     def flush_reco():
         nonlocal cur_rec_num, cur_rec_parts
@@ -190,119 +304,108 @@ def process_file(path: Path, ws, cols, start_row: int) -> int:
         cur_rec_num = None
         cur_rec_parts = []
 
-    lines = list(yield_lines_any(path))
-    i = 0
-    while i < len(lines):
-        line = lines[i]
-        m_proc = RE_PROCESS.match(line)
-        m_simple = RE_PROC_SIMPLE.match(line)
-        if m_proc or m_simple:
+    def flush_section():
+        for num in sorted(afis):
+            rec = recs.get(str(num), "")
+            for a in afis[num]:
+                rows.append(make_row(a.text, a.cls, a.ent, rec, process_label, path.name))
+
+    # stream lines; only the multi-line "(...)" lookahead is ever buffered
+    src = yield_lines_any(path)
+    ahead = deque()
+
+    def next_line():
+        return ahead.popleft() if ahead else next(src, None)
+
+    while True:
+        line = next_line()
+        if line is None:
+            break
+        c0 = line[0].lower()
+        m = LINE_KIND.match(line) if c0 in KIND_FIRST or c0.isdecimal() else None
+        kind = m.lastgroup if m else None
+        if kind == "process" or kind == "simple":
             flush_reco()
-            if afis or recs:
-                seq = 1
-                for a in afis:
-                    if a["num"] is None:
-                        a["num"] = seq; seq += 1
-                for a in sorted(afis, key=lambda x: int(x["num"])):
-                    n = str(a["num"]); rec = recs.get(n, "")
-                    write_row(ws, row, cols, a["text"], a["cls"], a["ent"], rec, process_label, path.name)
-                    row += 1
+            flush_section()
             in_afi = in_reco = False
-            if m_proc:
-                process_label = f"{m_proc.group(1)} – {m_proc.group(2)}"
+            if kind == "process":
+                process_label = f"{m.group('proc_no')} – {m.group('proc_name')}"
             else:
-                head = m_simple.group(1).capitalize()
-                tail = m_simple.group(2) or ""
+                head = m.group("simple_head").capitalize()
+                tail = m.group("simple_tail") or ""
                 process_label = f"{head}{(' – ' + tail) if tail else ''}"
-            afis, recs = [], {}
-            last_afi_idx = None
-            i += 1
+            afis, recs, seq = {}, {}, 1
+            last_afi = None
             continue
 
-        if RE_AFI_HDR.match(line):
+        if kind == "afi_hdr":
             flush_reco()
             in_afi, in_reco = True, False
-            last_afi_idx = None
-            i += 1
+            last_afi = None
             continue
-        if RE_RECO_HDR.match(line):
+        if kind == "reco_hdr":
             flush_reco()
             in_afi, in_reco = False, True
             cur_rec_num = None
             cur_rec_parts = []
-            i += 1
             continue
 
         if in_afi:
-            if re.fullmatch(r"\([^)]*\)", line):
+            if PAREN_LINE.fullmatch(line):
                 _, c, e = extract_ce_anywhere(line)
-                if last_afi_idx is not None and (c or e):
-                    if not afis[last_afi_idx]["cls"]: afis[last_afi_idx]["cls"] = c
-                    if not afis[last_afi_idx]["ent"]: afis[last_afi_idx]["ent"] = e
-                i += 1
+                if last_afi is not None and (c or e):
+                    if not last_afi.cls: last_afi.cls = c
+                    if not last_afi.ent: last_afi.ent = e
                 continue
 
-            m = RE_NUM_ITEM.match(line)
-            if m:
-                num  = int(m.group(1))
-                body = m.group(2)
-                clean, cls, ent, j = extract_ce_across_lines(lines, i, body)
-                afis.append({"num": num, "text": clean, "cls": cls, "ent": ent})
-                last_afi_idx = len(afis) - 1
-                i = max(i, j) + 1
+            if kind == "item":
+                num  = int(m.group("item_no"))
+                body = m.group("item_text")
+                clean, cls, ent, _ = extract_ce_across_lines(next_line, body)
+                last_afi = Afi(clean, cls, ent)
+                afis.setdefault(num, []).append(last_afi)
                 continue
 
-            if "(" in line:
-                clean, cls, ent, j = extract_ce_across_lines(lines, i, line)
-                if cls or ent:
-                    afis.append({"num": None, "text": clean, "cls": cls, "ent": ent})
-                    last_afi_idx = len(afis) - 1
-                    i = j + 1
-                    continue
-
-            i += 1
+            if "(" not in line:
+                continue
+            clean, cls, ent, used = extract_ce_across_lines(next_line, line)
+            if cls or ent:
+                last_afi = Afi(clean, cls, ent)
+                afis.setdefault(seq, []).append(last_afi)
+                seq += 1
+            else:
+                ahead.extendleft(reversed(used))
             continue
 
         if in_reco:
-            m = RE_NUM_ITEM.match(line)
-            if m:
+            if kind == "item":
                 flush_reco()
-                cur_rec_num  = m.group(1)
-                cur_rec_parts = [tidy(m.group(2))]
+                cur_rec_num  = m.group("item_no")
+                cur_rec_parts = [tidy(m.group("item_text"))]
             else:
                 if cur_rec_num is None:
                     cur_rec_num = "1"
                 cur_rec_parts.append(tidy(line))
-            i += 1
-            continue
-
-        i += 1
 
     flush_reco()
-    if afis or recs:
-        seq = 1
-        for a in afis:
-            if a["num"] is None:
-                a["num"] = seq; seq += 1
-        for a in sorted(afis, key=lambda x: int(x["num"])):
-            n = str(a["num"]); rec = recs.get(n, "")
-            write_row(ws, row, cols, a["text"], a["cls"], a["ent"], rec, process_label, path.name)
-            row += 1
-
-    return row
+    flush_section()
+    return rows
 
 # ========= MAIN =========
 def main():
-    wb, ws = open_or_create_workbook(XLSX_PATH, SHEET_NAME)
-    cols = detect_columns(ws)
-    row  = next_row(ws)
+    wb, ws, headers = open_or_create_workbook(XLSX_PATH, SHEET_NAME)
+    cols = detect_columns(headers)
+    width = max(cols)
     files = [p for p in INPUT_DIR.iterdir() if p.suffix.lower() in (".docx", ".pdf")]
     files = [p for p in files if not p.name.startswith("~$")]
     files.sort(key=lambda p: p.name.lower())
     print(f"Found {len(files)} files (.docx/.pdf).")
-    for i, f in enumerate(files, 1):
-        print(f"[{i}/{len(files)}] {f.name}")
-        row = process_file(f, ws, cols, row)
+    # parse in worker processes; rows come back in file order and are written here
+    with ProcessPoolExecutor() as ex:
+        for i, (f, rows) in enumerate(zip(files, ex.map(parse_file, files)), 1):
+            print(f"[{i}/{len(files)}] {f.name}")
+            for r in rows:
+                write_row(ws, cols, width, r)
     wb.save(XLSX_PATH)
     print(f"✅ Done → {XLSX_PATH}")
 